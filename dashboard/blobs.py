@@ -0,0 +1,59 @@
+from functools import lru_cache
+
+MAX_BLOB_BYTES = 1024 * 1024  # Larger blobs only have their head rendered
+
+def blob_id_at(repo, commit_id, path):
+    """OID of path as of commit_id; raises KeyError if the file isn't there."""
+    # Tree lookup only; the blob itself isn't read here
+    return repo[commit_id].tree[path].id
+
+def read_bytes(repo, blob_id):
+    # Straight out of the object database through the one open repository,
+    # no git subprocess per read; a memoryview over the blob avoids copying it
+    return memoryview(repo[blob_id])
+
+def is_truncated(repo, blob_id):
+    """True if read_text only returns the head of this blob."""
+    return repo[blob_id].size > MAX_BLOB_BYTES
+
+def _line_boundary(view, limit, chunk=4096):
+    """Offset just past the last newline before limit, scanning back a chunk at a time."""
+    stop = limit
+    while stop > 0:
+        start = max(0, stop - chunk)
+        newline = bytes(view[start:stop]).rfind(b"\n")
+        if newline >= 0:
+            return start + newline + 1
+        stop = start
+    # One enormous line: at least don't cut a UTF-8 sequence in half
+    while limit > 0 and view[limit] & 0xC0 == 0x80:
+        limit -= 1
+    return limit
+
+# Each entry can be up to MAX_BLOB_BYTES of decoded text, so keep these small
+@lru_cache(maxsize=64)
+def read_text(repo, blob_id) -> str:
+    """Decode a blob once per OID; commits that didn't touch the file share it."""
+    view = read_bytes(repo, blob_id)
+    if len(view) > MAX_BLOB_BYTES:
+        # Oversized blobs end on the last whole line that fits
+        view = view[:_line_boundary(view, MAX_BLOB_BYTES)]
+    # Decode straight from the blob's buffer; slicing the view copies nothing
+    return str(view, 'utf-8', 'replace')
+
+def split_lines(text) -> list:
+    """Split the way Pygments and Rich count rows: only newlines break a line.
+
+    str.splitlines also breaks on form feeds, \x1c-\x1e, \x85 and the Unicode
+    separators, which would throw line counts and gutter numbers off.
+    """
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    last = lines.pop() # Empty unless the text lacks a trailing newline
+    lines = [line + "\n" for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+@lru_cache(maxsize=16)
+def read_lines(repo, blob_id) -> list:
+    return split_lines(read_text(repo, blob_id))
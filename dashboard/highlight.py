@@ -0,0 +1,48 @@
+from functools import lru_cache
+from pygments.lexers import get_lexer_by_name
+from pygments.util import ClassNotFound
+from rich.syntax import DEFAULT_THEME, Syntax
+
+@lru_cache(maxsize=32)
+def get_lexer(name, tab_size=4):
+    """Resolve a Pygments lexer once per language instead of on every render."""
+    # Same options Rich uses when it looks the lexer up by name itself
+    try:
+        return get_lexer_by_name(name, stripnl=False, ensurenl=True, tabsize=tab_size)
+    except ClassNotFound:
+        return get_lexer_by_name("text", stripnl=False, ensurenl=True, tabsize=tab_size)
+
+@lru_cache(maxsize=8)
+def get_theme(name=DEFAULT_THEME):
+    """Resolve a syntax theme (and its Pygments style class) once."""
+    return Syntax.get_theme(name)
+
+class CachedSyntax(Syntax):
+    """A Syntax that tokenizes once and reuses the highlighted text on every render.
+
+    Plain Syntax re-runs Pygments each time it is rendered, which for a Live
+    display or a Textual repaint means every frame. Lexer and theme names are
+    resolved through the shared caches above, so no plugin lookup happens here.
+    """
+    _highlighted = None # (line_range, code, Text)
+
+    def __init__(self, code, lexer, *, theme=DEFAULT_THEME, tab_size=4, **kwargs):
+        if isinstance(lexer, str):
+            lexer = get_lexer(lexer, tab_size)
+        if isinstance(theme, str):
+            theme = get_theme(theme)
+        super().__init__(code, lexer, theme=theme, tab_size=tab_size, **kwargs)
+
+    def highlight(self, code, line_range=None):
+        cached = self._highlighted
+        if cached is None or cached[0] != line_range or cached[1] != code:
+            cached = (line_range, code, super().highlight(code, line_range))
+            self._highlighted = cached
+        # Rendering may mutate the Text, so hand out a copy
+        return cached[2].copy()
+
+    def prepare(self):
+        """Tokenize ahead of the first render (safe to call from a worker thread)."""
+        _, processed_code = self._process_code(self.code)
+        self.highlight(processed_code, self.line_range)
+        return self
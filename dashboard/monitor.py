@@ -1,20 +1,32 @@
-import time
 import os
-from git import Repo
+import queue
+import re
+import threading
+import time
+from collections import deque
+from itertools import pairwise
+from functools import lru_cache
+import pygit2
 from rich.console import Console
 from rich.layout import Layout
 from rich.panel import Panel
-from rich.syntax import Syntax
 from rich.live import Live
 from rich.table import Table
 from rich.text import Text
+from blobs import blob_id_at, read_bytes, read_text, split_lines
+from highlight import CachedSyntax
+from refwatch import RefWatcher
 
 # CONFIGURATION
 #REPO_PATH = "../slow-fib"  # Relative to dashboard/
 REPO_PATH = "../gravity-eater"  # Relative to dashboard/
+VIEW_MODE = "diff"  # "diff": ancestor -> survivor patch; "full": both files side by side
 
 console = Console()
 
+# Loop keywords that mark a survivor as iterative; one pass over the blob for all of them
+_ITER_RE = re.compile(rb"\bfor\b|\bwhile\b|\bloop\b")
+
 def get_layout():
     layout = Layout()
     layout.split(
@@ -22,52 +34,118 @@ def get_layout():
         Layout(name="main", ratio=1),
         Layout(name="footer", size=3),
     )
-    layout["main"].split_row(
-        Layout(name="left"),
-        Layout(name="right"),
-    )
+    if VIEW_MODE == "full":
+        layout["main"].split_row(
+            Layout(name="left"),
+            Layout(name="right"),
+        )
     return layout
 
-def get_file_content(repo, commit_id, filename="src/lib.rs"):
+def get_blob_id(repo, commit_id, filename="src/lib.rs"):
     try:
-        # Access the file at a specific commit
-        target_file = repo.commit(commit_id).tree / filename
-        content = target_file.data_stream.read().decode('utf-8')
-        return content
+        return blob_id_at(repo, commit_id, filename)
     except:
+        return None
+
+def get_file_content(repo, blob_id):
+    if blob_id is None:
         return "// File not found in this version"
+    return read_text(repo, blob_id)
+
+def visible_head(code, max_lines, overflow="// ... {} more lines\n"):
+    # The pane can't scroll, so only the lines that fit are worth tokenizing;
+    # the overflow marker has to read right in the pane's language
+    lines = split_lines(code)
+    if len(lines) <= max_lines:
+        return code
+    return "".join(lines[:max_lines - 1]) + overflow.format(len(lines) - max_lines + 1)
+
+@lru_cache(maxsize=1024)
+def classify_survivor(repo, blob_id):
+    # Pure function of the blob contents, so the scan runs once per OID
+    if blob_id is None:
+        return "yellow"
+    # Detect Iterative vs Recursive by scanning the raw blob bytes for loop keywords
+    return "green" if _ITER_RE.search(read_bytes(repo, blob_id)) else "yellow"
+
+@lru_cache(maxsize=8)
+def build_code_syntax(repo, blob_id, max_lines):
+    # Keyed on the blob, so commits that leave the file alone reuse the tokenized text
+    code = visible_head(get_file_content(repo, blob_id), max_lines)
+    return CachedSyntax(code, "rust", theme="monokai", line_numbers=True).prepare()
+
+@lru_cache(maxsize=8)
+def build_patch_syntax(repo, old_blob_id, new_blob_id, max_lines, filename):
+    # Diffing the two blobs directly, keyed on their OIDs, skips the tree walk
+    old_blob = repo[old_blob_id] if old_blob_id is not None else None
+    new_blob = repo[new_blob_id] if new_blob_id is not None else None
+    patch_text = pygit2.Patch.create_from(
+        old_blob, new_blob, old_as_path=filename, new_as_path=filename,
+        context_lines=3, interhunk_lines=0,
+    ).text
+    if not patch_text:
+        patch_text = f"# No changes to {filename} since the ancestor\n"
+    # A "//" comment would read as a patch line, so mark the cut like a hunk header
+    patch_head = visible_head(patch_text, max_lines, overflow="@@ ... {} more lines @@\n")
+    return CachedSyntax(patch_head, "diff", theme="monokai").prepare()
+
+@lru_cache(maxsize=1)
+def build_ancestor_panel(repo, root_sha, max_lines):
+    # The root commit is immutable, so this is only rebuilt if history is rewritten
+    syntax_left = build_code_syntax(repo, get_blob_id(repo, root_sha), max_lines)
+    return Panel(syntax_left, title=f"🦕 Ancestor (SHA: {root_sha[:7]})", style="red")
+
+@lru_cache(maxsize=1)
+def build_survivor_panel(repo, head_sha, max_lines):
+    survivor_blob_id = get_blob_id(repo, head_sha)
+    style_color = classify_survivor(repo, survivor_blob_id)
+    
+    syntax_right = build_code_syntax(repo, survivor_blob_id, max_lines)
+    return Panel(syntax_right, title=f"🚀 Survivor (SHA: {head_sha[:7]})", style=style_color)
+
+@lru_cache(maxsize=1)
+def build_diff_panel(repo, root_sha, head_sha, max_lines, filename="src/lib.rs"):
+    # Only the patch gets tokenized, so the work scales with the change, not the file
+    head_blob_id = get_blob_id(repo, head_sha, filename)
+    syntax = build_patch_syntax(repo, get_blob_id(repo, root_sha, filename), head_blob_id, max_lines, filename)
+    style_color = classify_survivor(repo, head_blob_id)
+    return Panel(
+        syntax,
+        title=f"🦕 Ancestor (SHA: {root_sha[:7]}) → 🚀 Survivor (SHA: {head_sha[:7]})",
+        style=style_color,
+    )
+
+def build_error_footer(error):
+    # Replaces "System Active" so a failed redraw doesn't pass for a live one
+    return Panel(Text(f"Error building frame: {error!r}", style="bold red"), style="red")
+
+def build_header():
+    title = Text("🧬 Project Evolve: Live Genome Tracker", style="bold magenta")
+    return Panel(title, style="on black")
+
+def generate_dashboard(repo):
+    """Does all the git and Pygments work for one redraw; returns {region: renderable}."""
+    frame = {}
 
-def generate_dashboard(layout, repo):
     # 1. Fetch Git Data
     try:
-        commits = list(repo.iter_commits())
+        commits = list(repo.walk(repo.head.target, pygit2.GIT_SORT_TOPOLOGICAL))
         head = commits[0]
         root = commits[-1]
     except Exception as e:
-        return # wait for repo init
-
-    # 2. Header
-    title = Text("🧬 Project Evolve: Live Genome Tracker", style="bold magenta")
-    layout["header"].update(Panel(title, style="on black"))
+        return None # wait for repo init
 
-    # 3. Left Pane (Ancestor)
-    ancestor_code = get_file_content(repo, root.hexsha)
-    syntax_left = Syntax(ancestor_code, "rust", theme="monokai", line_numbers=True)
-    layout["left"].update(
-        Panel(syntax_left, title=f"🦕 Ancestor (SHA: {root.hexsha[:7]})", style="red")
-    )
-
-    # 4. Right Pane (Survivor)
-    survivor_code = get_file_content(repo, head.hexsha)
-    # Detect Iterative vs Recursive simply by string matching for now
-    style_color = "green" if "for " in survivor_code or "while " in survivor_code else "yellow"
-    
-    syntax_right = Syntax(survivor_code, "rust", theme="monokai", line_numbers=True)
-    layout["right"].update(
-        Panel(syntax_right, title=f"🚀 Survivor (SHA: {head.hexsha[:7]})", style=style_color)
-    )
+    # 2. Code Panes (Ancestor / Survivor)
+    # Same object back between ticks when nothing changed, so Rich can skip the work
+    # (header, footer and the panel borders take 8 rows)
+    max_lines = max(1, console.size.height - 8)
+    if VIEW_MODE == "full":
+        frame["left"] = build_ancestor_panel(repo, str(root.id), max_lines)
+        frame["right"] = build_survivor_panel(repo, str(head.id), max_lines)
+    else:
+        frame["main"] = build_diff_panel(repo, str(root.id), str(head.id), max_lines)
 
-    # 5. Footer (Metrics)
+    # 3. Footer (Metrics)
     metrics_table = Table.grid(expand=True)
     metrics_table.add_column(justify="center", ratio=1)
     metrics_table.add_column(justify="center", ratio=1)
@@ -78,25 +156,120 @@ def generate_dashboard(layout, repo):
         f"[bold]Latest Msg:[/bold] {head.message.strip()}",
         "[bold green]System Active[/bold green]"
     )
-    layout["footer"].update(Panel(metrics_table, style="blue"))
+    frame["footer"] = Panel(metrics_table, style="blue")
+    return frame
+
+class RefreshPacer:
+    """Adapts the poll/redraw interval to how fast generations are landing."""
+    MIN_INTERVAL = 0.25
+    MAX_INTERVAL = 5.0
+    SNAP_FOR = 5.0  # Seconds after a new HEAD spent at the fastest rate
+    IDLE_AFTER = 30.0  # Seconds without a new HEAD before dropping to the slowest rate
+
+    def __init__(self, history=8, smoothing=0.3):
+        self.changes = deque(maxlen=history) # Monotonic timestamps of recent HEAD changes
+        self.smoothing = smoothing
+
+    def record_change(self):
+        self.changes.append(time.monotonic())
+
+    def gap(self, changes=None):
+        """EWMA of the time between the recorded HEAD changes, or None if unknown."""
+        # record_change() appends from the frame thread, so walk a snapshot
+        changes = tuple(self.changes) if changes is None else changes
+        gap = None
+        for prev, cur in pairwise(changes):
+            if cur - prev > self.IDLE_AFTER:
+                gap = None # An idle stretch says nothing about the burst after it
+            elif gap is None:
+                gap = cur - prev
+            else:
+                gap = self.smoothing * (cur - prev) + (1 - self.smoothing) * gap
+        return gap
+
+    def interval(self):
+        changes = tuple(self.changes)
+        if not changes:
+            return self.MAX_INTERVAL
+        since = time.monotonic() - changes[-1]
+        if since > self.IDLE_AFTER:
+            return self.MAX_INTERVAL
+        if since < self.SNAP_FOR:
+            return self.MIN_INTERVAL
+        # Past the snap window, poll at half the usual gap between generations
+        # (a lone change has no gap yet, so the time since it stands in)
+        gap = self.gap(changes)
+        return min(max((since if gap is None else gap) / 2, self.MIN_INTERVAL), self.MAX_INTERVAL)
+
+def produce_frames(repo, watcher, frames, pacer):
+    """Background thread: builds a frame per ref change or resize and queues it for run()."""
+    last_refs = last_size = None
+    while True:
+        # Only walk the history when a ref file was rewritten or the panes changed size
+        # (refs is None when the ref files can't be located; then walk every time)
+        refs, size = watcher.signature(), console.size
+        if refs is None or refs != last_refs or size != last_size:
+            try:
+                frame = generate_dashboard(repo)
+            except Exception as e:
+                # Show it and retry on the next wake-up instead of letting the thread die
+                frames.put({"footer": build_error_footer(e)})
+                frame = None
+            if frame is not None:
+                frames.put(frame)
+                # The first frame is startup, not git activity
+                if last_refs is not None and refs != last_refs:
+                    pacer.record_change()
+                last_refs, last_size = refs, size
+        # Only paced when polling; with the watcher running this wakes on ref writes
+        if not watcher.wait(pacer.interval()):
+            return
 
 def run():
     layout = get_layout()
+    # The header is static, so it's drawn once up front
+    layout["header"].update(build_header())
     try:
-        repo = Repo(REPO_PATH)
+        repo = pygit2.Repository(REPO_PATH)
     except:
         console.print(f"[red]Error: Could not find git repo at {REPO_PATH}[/red]")
         return
 
-    # The Live Context Manager handles the flicker-free rendering
-    with Live(layout, refresh_per_second=2, screen=True):
-        while True:
-            # Re-open repo to ensure we catch external git changes
-            # (GitPython caches objects, so we need to be careful, 
-            # but for a simple viewer, re-reading commit list is usually enough)
-            repo.git.clear_cache() 
-            generate_dashboard(layout, repo)
-            time.sleep(0.5)
+    # Redraw when the watcher reports a ref change instead of on a blind timer
+    watcher = RefWatcher(repo)
+    watcher.start()
+
+    # Disk reads and tokenization happen off the render loop
+    frames = queue.Queue()
+    pacer = RefreshPacer()
+    threading.Thread(target=produce_frames, args=(repo, watcher, frames, pacer), daemon=True).start()
+
+    # The Live Context Manager handles the flicker-free rendering; redraws are
+    # driven from here at the paced rate instead of a fixed refresh_per_second
+    with Live(layout, auto_refresh=False, screen=True) as live:
+        size = console.size
+        next_refresh = 0.0
+        try:
+            while True:
+                # Wake at the fastest rate so a resize is never left garbled for long;
+                # idle redraws still only happen at the paced rate
+                try:
+                    frame = frames.get(timeout=pacer.MIN_INTERVAL)
+                except queue.Empty:
+                    frame = None
+                for region, renderable in (frame or {}).items():
+                    layout[region].update(renderable)
+                resized = console.size != size
+                if resized:
+                    # The panes' line budget depends on the height, so have them rebuilt
+                    size = console.size
+                    watcher.wake()
+                now = time.monotonic()
+                if frame is not None or resized or now >= next_refresh:
+                    live.refresh()
+                    next_refresh = now + pacer.interval()
+        finally:
+            watcher.close()
 
 if __name__ == "__main__":
     run()
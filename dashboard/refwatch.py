@@ -0,0 +1,124 @@
+import threading
+from pathlib import Path
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+# Used when the filesystem watcher can't be started (watchdog missing,
+# inotify limits exhausted, network filesystems, ...)
+FALLBACK_POLL_SECONDS = 5.0
+
+# Only writes matter; open/close-without-write events would fire on our own reads
+_WRITE_EVENTS = ("created", "modified", "moved", "deleted")
+
+def _git_dirs(repo):
+    """(git dir, common dir) of an opened repo, or None if they can't be worked out.
+
+    HEAD lives in the git dir; branch refs and packed-refs live in the common
+    dir, which differs from it for linked worktrees. Bare repos and submodules
+    have no ".git" directory either, so both come from the repository itself.
+    """
+    try:
+        git_dir = Path(repo.path).resolve()
+        commondir = git_dir / "commondir"
+        if commondir.is_file():
+            # Written by git as a path relative to the worktree's git dir
+            return git_dir, (git_dir / commondir.read_text().strip()).resolve()
+        return git_dir, git_dir
+    except (AttributeError, TypeError, OSError):
+        return None
+
+class _RefEventHandler(FileSystemEventHandler):
+    """Sets an event whenever HEAD, packed-refs or a branch ref is rewritten."""
+    def __init__(self, git_dir, common_dir, changed):
+        super().__init__()
+        self.head = git_dir / "HEAD"
+        self.packed_refs = common_dir / "packed-refs"
+        self.heads_dir = common_dir / "refs" / "heads"
+        self.changed = changed
+
+    def on_any_event(self, event):
+        if event.event_type not in _WRITE_EVENTS:
+            return
+        # Git writes "<ref>.lock" and renames it into place, so the
+        # interesting path is the move destination when there is one
+        path = Path(getattr(event, "dest_path", "") or event.src_path)
+        if path.name.endswith(".lock"):
+            return
+        if path in (self.head, self.packed_refs):
+            self.changed.set()
+        elif self.heads_dir in path.parents:
+            self.changed.set()
+
+class RefWatcher:
+    """Wakes the dashboards up when the target repo's refs move."""
+    def __init__(self, repo):
+        self.dirs = _git_dirs(repo)
+        self.observer = None
+        self.closed = False
+        self._changed = threading.Event()
+
+    def start(self):
+        """Start watching; returns False (and falls back to polling) if that's not possible."""
+        if Observer is None or self.dirs is None:
+            return False
+        git_dir, common_dir = self.dirs
+        try:
+            handler = _RefEventHandler(git_dir, common_dir, self._changed)
+            observer = Observer()
+            observer.schedule(handler, str(git_dir), recursive=False)
+            if common_dir != git_dir:
+                observer.schedule(handler, str(common_dir), recursive=False)
+            observer.schedule(handler, str(common_dir / "refs" / "heads"), recursive=True)
+            observer.start()
+        except Exception:
+            return False
+        self.observer = observer
+        return True
+
+    def signature(self):
+        """Cheap fingerprint of HEAD and the branch refs; changes whenever a commit lands.
+
+        None when the ref files can't be located, in which case callers should
+        just walk the history.
+        """
+        if self.dirs is None:
+            return None
+        git_dir, common_dir = self.dirs
+        heads = common_dir / "refs" / "heads"
+        paths = [git_dir / "HEAD", common_dir / "packed-refs", *heads.rglob("*")]
+        entries = []
+        for path in paths:
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            # Refs are renamed into place, so the inode changes even when
+            # a coarse filesystem clock leaves the mtime alone
+            entries.append((str(path), st.st_mtime_ns, st.st_ino))
+        # Nothing found means we're looking in the wrong place, not that nothing changed
+        return tuple(entries) or None
+
+    def wait(self, poll_interval=FALLBACK_POLL_SECONDS):
+        """Block until a ref changes (or the next poll is due); False once closed."""
+        if self.observer is None:
+            self._changed.wait(poll_interval)
+        else:
+            self._changed.wait()
+        self._changed.clear()
+        return not self.closed
+
+    def wake(self):
+        """Return from wait() early, e.g. when something other than a ref needs a redraw."""
+        self._changed.set()
+
+    def close(self):
+        self.closed = True
+        self._changed.set()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
@@ -1,42 +1,142 @@
 import argparse
-import toml
+import os
+import threading
+import tomllib
+import weakref
+from functools import lru_cache
 from pathlib import Path
-from git import Repo
+import pygit2
+from cachetools import LRUCache
+from cachetools.keys import hashkey
+from textual import work
 from textual.app import App, ComposeResult
+from textual.message import Message
 from textual.containers import Container, VerticalScroll
 from textual.widgets import Header, Footer, Static, ListView, ListItem, Label
-from rich.syntax import Syntax
+from textual.worker import get_current_worker
+from blobs import MAX_BLOB_BYTES, blob_id_at, is_truncated, read_lines, read_text
+from highlight import CachedSyntax
+from refwatch import RefWatcher
+
+WINDOW_MIN_LINES = 1000  # Longer files only tokenize the slice that's on screen
+WINDOW_OVERSCAN = 50  # Lines kept highlighted above/below the viewport
+
+class _SyntaxCache:
+    """Bounded (blob OID, lexer, theme) -> CachedSyntax map.
+
+    The LRU keeps the most recent renderables alive. Entries it evicts stay
+    reachable through the weak map only while something else (the CodeWindow)
+    still holds them, so GC can reclaim the tokenized text of old generations.
+    """
+    def __init__(self, maxsize):
+        self.lru = LRUCache(maxsize=maxsize)
+        self.alive = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock() # Shared by the worker pool threads
+
+    def get(self, repo, blob_id, lexer, theme="monokai"):
+        # The OID already identifies the content, so there's nothing to hash
+        key = hashkey(blob_id, lexer, theme)
+        with self._lock:
+            syntax = self.lru.get(key) or self.alive.get(key)
+            if syntax is not None:
+                self.hits += 1
+                self.lru[key] = syntax
+                return syntax
+            self.misses += 1
+        syntax = CachedSyntax(read_text(repo, blob_id), lexer, theme=theme, line_numbers=True, word_wrap=True)
+        with self._lock:
+            self.lru[key] = syntax
+            self.alive[key] = syntax
+        return syntax
+
+_syntax_cache = _SyntaxCache(maxsize=64)
+
+@lru_cache(maxsize=64)
+def _render_window(repo, blob_id, lexer: str, start: int, stop: int) -> CachedSyntax:
+    """Highlight lines [start, stop) of a large blob, numbered as in the full file."""
+    code = "".join(read_lines(repo, blob_id)[start:stop])
+    return CachedSyntax(code, lexer, theme="monokai", line_numbers=True, start_line=start + 1)
+
+# Lexers for Rust, Python, and common config formats
+_EXT_TO_LEXER = {
+    ".rs": "rust",
+    ".py": "python",
+    ".toml": "toml",
+    ".tml": "toml",
+    ".yaml": "yaml",
+    ".yml": "yaml",
+    ".json": "json",
+    ".md": "markdown",
+    ".markdown": "markdown",
+}
+
+@lru_cache(maxsize=256)
+def _detect_lexer(filename: str) -> str:
+    """Detect the appropriate lexer based on file extension."""
+    return _EXT_TO_LEXER.get(os.path.splitext(filename)[1].lower(), "text")  # Fallback for unknown types
 
 class CodeWindow(Static):
     """Display code with syntax highlighting."""
-    def show_code(self, code, gen_id, filename):
-        # Lexer detection for Rust, Python, and common config formats
-        lexer = self._detect_lexer(filename)
-        
-        self.update(Syntax(code, lexer, theme="monokai", line_numbers=True, word_wrap=True))
+    _window_source = None # (repo, blob_id, lexer, line_count) while a large file is shown
+    _window = None # (start, stop) of the lines currently rendered
+
+    def on_mount(self):
+        self.watch(self.parent, "scroll_y", self._update_window, init=False)
+
+    def show_code(self, syntax, gen_id, filename):
+        self.show_message(syntax)
         self.parent.border_title = f"{filename} ({gen_id})"
-    
-    def _detect_lexer(self, filename: str) -> str:
-        """Detect the appropriate lexer based on file extension."""
-        if filename.endswith(".rs"):
-            return "rust"
-        elif filename.endswith(".py"):
-            return "python"
-        elif filename.endswith((".toml", ".tml")):
-            return "toml"
-        elif filename.endswith((".yaml", ".yml")):
-            return "yaml"
-        elif filename.endswith(".json"):
-            return "json"
-        elif filename.endswith((".md", ".markdown")):
-            return "markdown"
-        else:
-            return "text"  # Fallback for unknown types
+
+    def show_window(self, repo, blob_id, lexer, line_count, gen_id, filename):
+        """Large files: keep the full scroll height, but only tokenize the lines in view."""
+        self._window_source = (repo, blob_id, lexer, line_count)
+        self._window = None
+        # One row per line (no wrapping) so scroll offsets map straight to line numbers
+        self.styles.height = line_count
+        self._update_window()
+        self.parent.border_title = f"{filename} ({gen_id})"
+
+    def show_message(self, renderable):
+        self._window_source = None
+        self.styles.height = "auto"
+        self.styles.padding = 0
+        self.update(renderable)
+
+    def _update_window(self, *_):
+        if self._window_source is None:
+            return
+        repo, blob_id, lexer, line_count = self._window_source
+        top = int(self.parent.scroll_y)
+        height = self.parent.size.height
+        if self._window and self._window[0] <= top and top + height <= self._window[1]:
+            return
+        # Snap to overscan-sized steps so nearby scroll positions share cached windows
+        start = max(0, (top - WINDOW_OVERSCAN) // WINDOW_OVERSCAN * WINDOW_OVERSCAN)
+        stop = min(line_count, start + (height // WINDOW_OVERSCAN + 3) * WINDOW_OVERSCAN)
+        self._window = (start, stop)
+        self._prepare_window(self._window_source, start, stop)
+
+    @work(exclusive=True, thread=True, group="window")
+    def _prepare_window(self, source, start, stop):
+        # Tokenize off the event loop; scrolling on supersedes a window still in flight
+        repo, blob_id, lexer, _ = source
+        syntax = _render_window(repo, blob_id, lexer, start, stop).prepare()
+        if not get_current_worker().is_cancelled:
+            self.app.call_from_thread(self._apply_window, source, start, stop, syntax)
+
+    def _apply_window(self, source, start, stop, syntax):
+        if self._window_source is not source or self._window != (start, stop):
+            return # Another file or scroll position took over meanwhile
+        # Lines above the window are just padding; nothing there gets tokenized
+        self.styles.padding = (start, 0, 0, 0)
+        self.update(syntax)
 
 class GenerationItem(ListItem):
     """A selectable item representing a generation."""
     def __init__(self, commit, generation_num):
-        self.commit_hex = commit.hexsha
+        self.commit_hex = str(commit.id)
         msg = commit.message.split('\n')[0].strip()
         self.message = msg
         self.generation_num = generation_num
@@ -58,7 +158,10 @@ class EvolutionApp(App):
     ListItem:hover { background: $primary-background-darken-2; }
     """
 
-    BINDINGS = [("q", "quit", "Quit"), ("r", "refresh_repo", "Refresh")]
+    BINDINGS = [("q", "quit", "Quit"), ("r", "refresh_repo", "Refresh"), ("d", "cache_stats", "Cache Stats")]
+
+    class RefsChanged(Message):
+        """Posted from the watcher thread when the target repo's refs move."""
 
     def __init__(self, target_dir):
         super().__init__()
@@ -67,11 +170,29 @@ class EvolutionApp(App):
         self.repo = None
         self.primary_file = "src/lib.rs" # Default fallback
         self.files_list = []
+        self._known_shas = [] # Commits already in the sidebar, oldest first
+        self._refs_signature = None # Ref file stats as of the last history walk
+        self._config_cache = None # (mtime_ns, parsed Evolve.toml)
+        self._last_request = 0 # Bumped per selection so stale renders can be dropped
+        self._watcher = RefWatcher(None) # Replaced once the repo is open; polls until then
 
     def on_mount(self):
         self.title = f"🧬 Evolve Lab: {self.target_path.name}"
         self.load_config()
         self.load_repo()
+        self._watcher.start()
+        self.run_worker(self._watch_refs, thread=True)
+
+    def on_unmount(self):
+        self._watcher.close()
+
+    def _watch_refs(self):
+        # Runs in a worker thread; hands each ref change back to the event loop
+        while self._watcher.wait():
+            self.post_message(self.RefsChanged())
+
+    def on_evolution_app_refs_changed(self, message: RefsChanged):
+        self.refresh_history()
 
     def load_config(self):
         """CRITICAL: Reads Evolve.toml to determine what file to show."""
@@ -79,8 +200,12 @@ class EvolutionApp(App):
         
         if config_path.exists():
             try:
-                # Load the TOML
-                data = toml.load(str(config_path))
+                # Load the TOML, skipping the parse if the file hasn't changed
+                mtime_ns = config_path.stat().st_mtime_ns
+                if self._config_cache is None or self._config_cache[0] != mtime_ns:
+                    with config_path.open("rb") as f:
+                        self._config_cache = (mtime_ns, tomllib.load(f))
+                data = self._config_cache[1]
                 
                 # Extract file list
                 self.files_list = data.get("evolution", {}).get("files", [])
@@ -105,27 +230,46 @@ class EvolutionApp(App):
 
     def load_repo(self):
         try:
-            self.repo = Repo(self.target_path)
+            self.repo = pygit2.Repository(str(self.target_path))
+            # Ref locations come from the opened repo (worktrees, bare repos, submodules)
+            self._watcher = RefWatcher(self.repo)
             self.refresh_history()
         except Exception as e:
-            self.query_one(CodeWindow).update(f"Error loading git repo at {self.target_path}:\n{e}")
+            self.query_one(CodeWindow).show_message(f"Error loading git repo at {self.target_path}:\n{e}")
 
-    def refresh_history(self):
+    def refresh_history(self, force=False):
+        # Nothing to walk unless a ref file was rewritten since last time
+        # (or the ref files couldn't be found, in which case always walk)
+        refs = self._watcher.signature()
+        if not force and refs is not None and refs == self._refs_signature:
+            return
         try:
-            self.repo.git.clear_cache()
-            commits = list(self.repo.iter_commits())[::-1] 
+            # Oldest first, straight from the walker (no reversing needed)
+            commits = list(self.repo.walk(self.repo.head.target, pygit2.GIT_SORT_TOPOLOGICAL | pygit2.GIT_SORT_REVERSE))
+            self._refs_signature = refs
         except:
             commits = []
+        shas = [str(commit.id) for commit in commits]
 
         list_view = self.query_one(ListView)
-        list_view.clear()
-        
-        for i, commit in enumerate(commits):
+        known = len(self._known_shas)
+        if shas[:known] == self._known_shas:
+            # Old generations never change, so only append the ones we haven't seen
+            if len(shas) == known:
+                return
+            start = known
+        else:
+            # History was rewritten (rebase, reset): rebuild from scratch
+            list_view.clear()
+            start = 0
+        self._known_shas = shas
+
+        for i, commit in enumerate(commits[start:], start):
             list_view.append(GenerationItem(commit, i))
-            
+
         if commits:
             list_view.index = len(commits) - 1
-            self.show_commit(commits[-1], len(commits)-1)
+            self.show_commit(str(commits[-1].id), len(commits)-1)
 
     def compose(self) -> ComposeResult:
         yield Header()
@@ -135,37 +279,77 @@ class EvolutionApp(App):
 
     def on_list_view_selected(self, event: ListView.Selected):
         item = event.item
-        commit = self.repo.commit(item.commit_hex)
-        self.show_commit(commit, item.generation_num)
+        self.show_commit(item.commit_hex, item.generation_num)
+
+    def _build_renderable(self, commit_id, filename):
+        """Runs in a worker thread: blob read, decode and tokenization."""
+        # Look for the dynamically selected file in the tree
+        blob_id = blob_id_at(self.repo, commit_id, filename)
+        lexer = _detect_lexer(filename)
+        line_count = len(read_lines(self.repo, blob_id))
+        truncated = is_truncated(self.repo, blob_id)
+        if line_count > WINDOW_MIN_LINES:
+            return blob_id, lexer, line_count, truncated, None # CodeWindow highlights it a window at a time
+        # Flipping between generations with identical content reuses the tokenized Syntax
+        return blob_id, lexer, line_count, truncated, _syntax_cache.get(self.repo, blob_id, lexer).prepare()
+
+    def show_commit(self, commit_id, gen_num):
+        """Start rendering a generation; returns at once so the message queue keeps moving."""
+        self._last_request += 1
+        self._render_commit(self._last_request, commit_id, gen_num, self.primary_file)
 
-    def show_commit(self, commit, gen_num):
+    @work(exclusive=True, thread=True, group="render")
+    def _render_commit(self, request_id, commit_id, gen_num, filename):
+        # Exclusive: starting a new render cancels the one still in flight
         try:
-            # Look for the dynamically selected file in the tree
-            target_blob = commit.tree / self.primary_file
-            content = target_blob.data_stream.read().decode('utf-8')
-            self.query_one(CodeWindow).show_code(content, f"Gen {gen_num}", self.primary_file)
-        except KeyError:
-            self.query_one(CodeWindow).update(f"// File '{self.primary_file}' not found in Generation {gen_num}")
-            self.query_one(CodeWindow).parent.border_title = f"{self.primary_file} (Missing)"
+            result = self._build_renderable(commit_id, filename)
         except Exception as e:
-            self.query_one(CodeWindow).update(f"Error reading file: {e}")
+            result = e
+        if not get_current_worker().is_cancelled:
+            self.call_from_thread(self._apply_render, request_id, gen_num, filename, result)
+
+    def _apply_render(self, request_id, gen_num, filename, result):
+        if request_id != self._last_request:
+            return # A newer selection already took over the window
+
+        code_window = self.query_one(CodeWindow)
+        if isinstance(result, KeyError):
+            code_window.show_message(f"// File '{filename}' not found in Generation {gen_num}")
+            code_window.parent.border_title = f"{filename} (Missing)"
+        elif isinstance(result, Exception):
+            code_window.show_message(f"Error reading file: {result}")
+        else:
+            blob_id, lexer, line_count, truncated, syntax = result
+            gen_id = f"Gen {gen_num}"
+            if truncated:
+                # Only the head was decoded; say so rather than let the last line number pass for the end
+                gen_id += f", first {MAX_BLOB_BYTES // 1024} KiB only"
+            if syntax is None:
+                code_window.show_window(self.repo, blob_id, lexer, line_count, gen_id, filename)
+            else:
+                code_window.show_code(syntax, gen_id, filename)
 
     def action_refresh_repo(self):
         self.load_config() # Reload config in case you changed Evolve.toml mid-run
-        self.refresh_history()
+        self.refresh_history(force=True)
+        # The tracked file may have changed, so redraw whatever is selected
+        item = self.query_one(ListView).highlighted_child
+        if item is not None:
+            self.show_commit(item.commit_hex, item.generation_num)
         self.notify("Repository & Config Refreshed")
 
+    def action_cache_stats(self):
+        # Debug aid for tuning the cache sizes
+        cache = _syntax_cache
+        self.notify(
+            f"syntax cache: {cache.lru.currsize}/{cache.lru.maxsize}, hits={cache.hits}, misses={cache.misses}, "
+            f"windows: {_render_window.cache_info().currsize}/{_render_window.cache_info().maxsize}"
+        )
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Evolve Dashboard")
     parser.add_argument("--target", required=True, help="Path to the target repository")
     args = parser.parse_args()
 
-    # Ensure toml is installed
-    try:
-        import toml
-    except ImportError:
-        print("Error: 'toml' library missing. Run: uv add toml")
-        exit(1)
-
     app = EvolutionApp(args.target)
     app.run()